@@ -1,15 +1,24 @@
-import json
-import sqlparse
-from sqlparse.tokens import Keyword, Number, Token
+import queue
+import re
+import threading
+import time
 import uuid
+from functools import wraps
+import orjson
 import sqlalchemy
+import sqlglot
+from sqlglot import exp
 from ninja import NinjaAPI
 from ninja.errors import HttpError, ValidationError
 from ninja.responses import Response
 from pydantic.error_wrappers import ValidationError as PydanticValidationError
 import sqlalchemy.exc
 
-from django.http import StreamingHttpResponse
+from django.db.models import Count, Window
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from ddpui import auth
 from ddpui.core import dbtautomation_service
 from ddpui.models.org import OrgWarehouse
@@ -36,12 +45,55 @@ from ddpui.models.llm import (
     LlmAssistantType,
 )
 from ddpui.utils import secretsmanager
-from ddpui.utils.helpers import convert_to_standard_types
+from ddpui.utils.helpers import (
+    convert_to_standard_types,
+    convert_table_rows_to_standard_types,
+    gzip_chunks,
+)
 from ddpui.utils.constants import LIMIT_ROWS_TO_SEND_TO_LLM
+from ddpui.utils.warehouse_metadata_cache import (
+    COLUMN_CATALOG_TTL_SECONDS,
+    warehouse_metadata_cache_key,
+    get_warehouse_metadata,
+    set_warehouse_metadata,
+)
 
 warehouseapi = NinjaAPI(urls_namespace="warehouse")
 logger = CustomLogger("ddpui")
 
+# anything in a query that writes to the warehouse
+_SQL_WRITE_EXPRESSIONS = (
+    exp.DML,
+    exp.DDL,
+    exp.Update,
+    exp.Merge,
+    exp.Drop,
+    exp.Alter,
+    exp.TruncateTable,
+    exp.Into,
+    exp.Command,
+)
+
+# org_id -> (expires_at, warehouse), shared by the requests this process serves
+# saves & deletes here evict at once; other processes pick them up within the ttl
+ORG_WAREHOUSE_CACHE_TTL_SECONDS = 30
+_org_warehouse_cache: dict = {}
+
+# cheap check before parsing: skip whitespace, comments & parens, then expect select / with
+# matches with no keyword when the sql is empty
+# every branch can match a given prefix in only one way; keep it so, or it backtracks
+# exponentially on input like "-- -- -- ..."
+_SQL_SELECT_PREFIX = re.compile(
+    r"\A(?:\s|--[^\n]*(?:\n|\Z)|#[^\n]*(?:\n|\Z)|/\*(?:[^*]|\*(?!/))*\*/|\()*"
+    r"(?:(select|with)\b|\Z)",
+    re.IGNORECASE,
+)
+
+# one coding of an Accept-Encoding header, e.g. "gzip", "gzip;q=0.5" or "*;q=0"
+_ACCEPT_ENCODING_CODING = re.compile(
+    r"\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]*))?", re.IGNORECASE
+)
+
 
 @warehouseapi.exception_handler(ValidationError)
 def ninja_validation_error_handler(request, exc):  # pylint: disable=unused-argument
@@ -74,14 +126,80 @@ def ninja_default_error_handler(
     return Response({"detail": "something went wrong"}, status=500)
 
 
+def get_org_warehouse(request) -> OrgWarehouse | None:
+    """
+    Fetches the warehouse of the requesting orguser's org
+    The lookup is memoized on the request, and shared across requests for a few seconds
+    """
+    if "_org_warehouse" not in request.__dict__:
+        org_id = request.orguser.org_id
+        now = time.monotonic()
+        cached = _org_warehouse_cache.get(org_id)
+        if cached is None or cached[0] <= now:
+            cached = (
+                now + ORG_WAREHOUSE_CACHE_TTL_SECONDS,
+                OrgWarehouse.objects.filter(org_id=org_id).first(),
+            )
+            # orgs without a warehouse yet are not cached, so a new one shows up at once
+            if cached[1] is not None:
+                _org_warehouse_cache[org_id] = cached
+        request._org_warehouse = cached[1]
+    return request._org_warehouse
+
+
+@receiver(
+    [post_save, post_delete],
+    sender=OrgWarehouse,
+    dispatch_uid="evict_cached_org_warehouse",
+)
+def evict_cached_org_warehouse(
+    sender, instance: OrgWarehouse, **kwargs
+):  # pylint: disable=unused-argument
+    """drops the org's warehouse from the cache when it is saved or deleted"""
+    _org_warehouse_cache.pop(instance.org_id, None)
+
+
+def warehouse_metadata_cache(ttl: int = 60):
+    """
+    Caches an endpoint's response in redis for ttl seconds, keyed by
+    (org, warehouse type, endpoint, warehouse id & updated_at, args); so an updated or
+    recreated warehouse misses the cache. Cleared when a pipeline completes
+    """
+
+    def decorator(api_endpoint):
+        @wraps(api_endpoint)
+        def wrapper(request, *args, **kwargs):
+            org_warehouse = get_org_warehouse(request)
+            if org_warehouse is None:
+                return api_endpoint(request, *args, **kwargs)
+
+            key = warehouse_metadata_cache_key(
+                org_warehouse.org_id,
+                org_warehouse.wtype,
+                api_endpoint.__name__,
+                org_warehouse.id,
+                org_warehouse.updated_at.timestamp(),
+                *args,
+                *[kwargs[name] for name in sorted(kwargs)],
+            )
+            data = get_warehouse_metadata(key)
+            if data is None:
+                data = api_endpoint(request, *args, **kwargs)
+                set_warehouse_metadata(key, data, ttl)
+            return data
+
+        return wrapper
+
+    return decorator
+
+
 def get_warehouse_data(request, data_type: str, **kwargs):
     """
     Fetches data from a warehouse based on the data type
     and optional parameters
     """
     try:
-        org_user = request.orguser
-        org_warehouse = OrgWarehouse.objects.filter(org=org_user.org).first()
+        org_warehouse = get_org_warehouse(request)
 
         data = []
         client = dbtautomation_service._get_wclient(org_warehouse)
@@ -100,10 +218,7 @@ def get_warehouse_data(request, data_type: str, **kwargs):
                 order_by=kwargs["order_by"],
                 order=kwargs["order"],
             )
-            for element in data:
-                for key, value in element.items():
-                    if (isinstance(value, list) or isinstance(value, dict)) and value:
-                        element[key] = json.dumps(value)
+            return convert_table_rows_to_standard_types(data)
     except Exception as error:
         logger.exception(f"Exception occurred in get_{data_type}: {error}")
         raise HttpError(500, f"Failed to get {data_type}")
@@ -113,6 +228,7 @@ def get_warehouse_data(request, data_type: str, **kwargs):
 
 @warehouseapi.get("/tables/{schema_name}", auth=auth.CustomAuthMiddleware())
 @has_permission(["can_view_warehouse_data"])
+@warehouse_metadata_cache(ttl=60)
 def get_table(request, schema_name: str):
     """Fetches table names from a warehouse"""
     return get_warehouse_data(request, "tables", schema_name=schema_name)
@@ -120,6 +236,7 @@ def get_table(request, schema_name: str):
 
 @warehouseapi.get("/schemas", auth=auth.CustomAuthMiddleware())
 @has_permission(["can_view_warehouse_data"])
+@warehouse_metadata_cache(ttl=300)
 def get_schema(request):
     """Fetches schema names from a warehouse"""
     return get_warehouse_data(request, "schemas")
@@ -129,6 +246,7 @@ def get_schema(request):
     "/table_columns/{schema_name}/{table_name}", auth=auth.CustomAuthMiddleware()
 )
 @has_permission(["can_view_warehouse_data"])
+@warehouse_metadata_cache(ttl=60)
 def get_table_columns(request, schema_name: str, table_name: str):
     """Fetches column names for a specific table from a warehouse"""
     return get_warehouse_data(
@@ -150,7 +268,7 @@ def get_table_data(
     order: int = 1,
 ):
     """Fetches data from a specific table in a warehouse"""
-    return get_warehouse_data(
+    data = get_warehouse_data(
         request,
         "table_data",
         schema_name=schema_name,
@@ -160,6 +278,10 @@ def get_table_data(
         order_by=order_by,
         order=order,
     )
+    # pages can be large; serialize with orjson instead of ninja's json renderer
+    return HttpResponse(
+        orjson.dumps(data, default=str), content_type="application/json"
+    )
 
 
 @warehouseapi.get(
@@ -169,8 +291,7 @@ def get_table_data(
 def get_table_count(request, schema_name: str, table_name: str):
     """Fetches the total number of rows for a specified table."""
     try:
-        org_user = request.orguser
-        org_warehouse = OrgWarehouse.objects.filter(org=org_user.org).first()
+        org_warehouse = get_org_warehouse(request)
 
         client = dbtautomation_service._get_wclient(org_warehouse)
         total_rows = client.get_total_rows(schema_name, table_name)
@@ -188,10 +309,7 @@ def get_json_column_spec(
     request, source_schema: str, input_name: str, json_column: str
 ):
     """Get the json column spec of a table in a warehouse"""
-    orguser = request.orguser
-    org = orguser.org
-
-    org_warehouse = OrgWarehouse.objects.filter(org=org).first()
+    org_warehouse = get_org_warehouse(request)
     if not org_warehouse:
         raise HttpError(404, "Please set up your warehouse first")
 
@@ -212,20 +330,33 @@ def get_warehouse_table_columns_spec(request, schema_name: str, table_name: str)
     """
     Get the json column(s) spec of a table in a warehouse
     This fetches table data using the sqlalchemy engine client
+    Specs are kept in a per table column catalog in redis
     """
-    orguser = request.orguser
-    org = orguser.org
-
-    org_warehouse = OrgWarehouse.objects.filter(org=org).first()
+    org_warehouse = get_org_warehouse(request)
     if not org_warehouse:
         raise HttpError(404, "Please set up your warehouse first")
 
-    credentials = secretsmanager.retrieve_warehouse_credentials(org_warehouse)
+    # updated_at changes with the credentials, so a re-pointed warehouse starts afresh
+    catalog_key = warehouse_metadata_cache_key(
+        org_warehouse.org_id,
+        org_warehouse.wtype,
+        "column_catalog",
+        org_warehouse.id,
+        org_warehouse.updated_at.timestamp(),
+        schema_name,
+        table_name,
+    )
+    cols = get_warehouse_metadata(catalog_key)
+    if cols is not None:
+        return cols
+
+    credentials = secretsmanager.retrieve_warehouse_credentials_cached(org_warehouse)
 
     try:
         wclient = WarehouseFactory.connect(credentials, wtype=org_warehouse.wtype)
 
         cols = wclient.get_table_columns(schema_name, table_name)
+        set_warehouse_metadata(catalog_key, cols, COLUMN_CATALOG_TTL_SECONDS)
         return cols
     except sqlalchemy.exc.NoSuchTableError:
         raise HttpError(404, "Table not found")
@@ -241,10 +372,7 @@ def post_data_insights(request, payload: RequestorColumnSchema):
     Run all the require queries to fetch insights for a column
     Will also save to redis results as queries are processed
     """
-    orguser = request.orguser
-    org = orguser.org
-
-    org_warehouse = OrgWarehouse.objects.filter(org=org).first()
+    org_warehouse = get_org_warehouse(request)
     if not org_warehouse:
         raise HttpError(404, "Please set up your warehouse first")
 
@@ -269,6 +397,87 @@ def post_data_insights(request, payload: RequestorColumnSchema):
         raise HttpError(500, str(err))
 
 
+class _CsvChunkSink:
+    """file-like sink for copy_table_to_csv; hands the csv to put() in chunks of chunk_size"""
+
+    def __init__(self, put, chunk_size: int):
+        self.put = put
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        """buffer the data; pass it on once a chunk has built up"""
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """pass on whatever is buffered"""
+        if self.buffer:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def stream_table_csv(wclient, schema_name: str, table_name: str, chunk_size=1 << 20):
+    """
+    Runs the client's copy_table_to_csv in a thread & yields the csv while it is written
+    The copy is stopped if the download is abandoned
+    """
+    chunks = queue.Queue(maxsize=8)
+    abandoned = threading.Event()
+
+    def put(item):
+        while not abandoned.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+        raise IOError(f"download of {schema_name}.{table_name} was abandoned")
+
+    def copy():
+        sink = _CsvChunkSink(put, chunk_size)
+        try:
+            wclient.copy_table_to_csv(schema_name, table_name, sink)
+            sink.flush()
+            put(None)
+            logger.info(f"Streamed {schema_name}.{table_name} as csv")
+        except Exception as err:  # pylint:disable=broad-exception-caught
+            if not abandoned.is_set():
+                logger.exception(err)
+                put(err)
+
+    threading.Thread(target=copy, daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        abandoned.set()
+
+
+def accepts_gzip_encoding(accept_encoding: str) -> bool:
+    """
+    whether an Accept-Encoding header allows gzip; codings with q=0 are refused and an
+    explicit gzip entry wins over "*"
+    """
+    qvalues = {}
+    for coding in accept_encoding.split(","):
+        match = _ACCEPT_ENCODING_CODING.match(coding)
+        if not match:
+            continue
+        try:
+            qvalue = float(match.group(2)) if match.group(2) is not None else 1.0
+        except ValueError:
+            qvalue = 0.0
+        qvalues[match.group(1).lower()] = qvalue
+    return qvalues.get("gzip", qvalues.get("*", 0.0)) > 0
+
+
 @warehouseapi.get(
     "/download/{schema_name}/{table_name}", auth=auth.CustomAuthMiddleware()
 )
@@ -276,43 +485,28 @@ def post_data_insights(request, payload: RequestorColumnSchema):
 def get_download_warehouse_data(request, schema_name: str, table_name: str):
     """Stream and download data from a table in the warehouse"""
 
-    orguser = request.orguser
-    org = orguser.org
-
-    org_warehouse = OrgWarehouse.objects.filter(org=org).first()
+    org_warehouse = get_org_warehouse(request)
     if not org_warehouse:
         raise HttpError(404, "Please set up your warehouse first")
 
-    def stream_warehouse_data(
-        request, schema_name, table_name, page_size=10, order_by=None, order=1
-    ):
-        page = 0
-        header_written = False
-        while True:
-            data = get_warehouse_data(
-                request,
-                "table_data",
-                schema_name=schema_name,
-                table_name=table_name,
-                page=page,
-                limit=page_size,
-                order_by=order_by,
-                order=order,
-            )
-            if not data:
-                break
-            if not header_written:
-                yield ",".join(data[0].keys()) + "\n"  # Write CSV header
-                header_written = True
-            for row in data:
-                yield ",".join(map(str, row.values())) + "\n"  # Write CSV row
-            page += 1
-            logger.info(f"Streaming page {page} of {schema_name}.{table_name}")
+    credentials = secretsmanager.retrieve_warehouse_credentials_cached(org_warehouse)
 
+    try:
+        wclient = WarehouseFactory.connect(credentials, wtype=org_warehouse.wtype)
+    except Exception as err:
+        logger.error(err)
+        raise HttpError(500, str(err)) from err
+
+    chunks = stream_table_csv(wclient, schema_name, table_name)
+    # csv compresses well; gzip it on the fly for clients that accept it
+    accepts_gzip = accepts_gzip_encoding(request.headers.get("Accept-Encoding", ""))
     response = StreamingHttpResponse(
-        stream_warehouse_data(request, schema_name, table_name, page_size=30000),
+        gzip_chunks(chunks) if accepts_gzip else chunks,
         content_type="application/octet-stream",
     )
+    if accepts_gzip:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
     response["Content-Disposition"] = (
         f"attachment; filename={schema_name}__{table_name}.csv"
     )
@@ -327,7 +521,30 @@ def post_warehouse_prompt(request, payload: AskWarehouseRequest):
     Ask the warehouse a question/prompt on a result set and get a response from llm service
     Be default a new session will be saved
     """
-    stmts = sqlparse.parse(payload.sql)
+    orguser: OrgUser = request.orguser
+
+    org_warehouse = get_org_warehouse(request)
+    if not org_warehouse:
+        raise HttpError(404, "Please set up your warehouse first")
+
+    # reject obvious non-selects without paying for a parse
+    prefix = _SQL_SELECT_PREFIX.match(payload.sql)
+    if prefix is None:
+        raise HttpError(400, "Only SELECT queries are allowed")
+    if prefix.group(1) is None:
+        raise HttpError(400, "No query provided")
+
+    # parse once in the warehouse's dialect; validation & limit rewrite share the tree
+    dialect = org_warehouse.wtype or None
+    try:
+        stmts = [
+            stmt
+            for stmt in sqlglot.parse(payload.sql, read=dialect)
+            if stmt is not None
+        ]
+    except sqlglot.errors.SqlglotError as err:
+        logger.error(err)
+        raise HttpError(400, "Unable to parse the query") from err
 
     if len(stmts) > 1:
         raise HttpError(400, "Only one query is allowed")
@@ -335,40 +552,31 @@ def post_warehouse_prompt(request, payload: AskWarehouseRequest):
     if len(stmts) == 0:
         raise HttpError(400, "No query provided")
 
-    if not stmts[0].get_type() == "SELECT":
+    tree = stmts[0]
+    if not isinstance(tree, exp.Query) or tree.find(*_SQL_WRITE_EXPRESSIONS):
         raise HttpError(400, "Only SELECT queries are allowed")
 
-    orguser: OrgUser = request.orguser
-    org = orguser.org
-
-    org_warehouse = OrgWarehouse.objects.filter(org=org).first()
-    if not org_warehouse:
-        raise HttpError(404, "Please set up your warehouse first")
-
     # limit the records going to llm
-    limit = float("inf")
-    limit_found = False
-    for stmt in stmts:
-        for token in stmt.tokens:
-            if (
-                not limit_found
-                and token.ttype is Keyword
-                and token.value.upper() == "LIMIT"
-            ):
-                limit_found = True
-            if limit_found and token.ttype is Token.Literal.Number.Integer:
-                limit = int(token.value)
-                break
-
-    if limit_found and limit > LIMIT_ROWS_TO_SEND_TO_LLM:
-        raise HttpError(
-            400,
-            f"Please make sure the limit in query is less than {LIMIT_ROWS_TO_SEND_TO_LLM}",
+    limit = tree.args.get("limit")
+    if limit is not None:
+        count = (
+            limit.args.get("count")
+            if isinstance(limit, exp.Fetch)
+            else limit.expression
         )
-
-    if not limit_found:
+        if (
+            not isinstance(count, exp.Literal)
+            or not count.is_int
+            or int(count.name) > LIMIT_ROWS_TO_SEND_TO_LLM
+        ):
+            raise HttpError(
+                400,
+                f"Please make sure the limit in query is less than {LIMIT_ROWS_TO_SEND_TO_LLM}",
+            )
+    else:
         logger.info(f"Setting LIMIT {LIMIT_ROWS_TO_SEND_TO_LLM} to the query")
-        payload.sql = f"{payload.sql} LIMIT {LIMIT_ROWS_TO_SEND_TO_LLM}"
+        tree.limit(LIMIT_ROWS_TO_SEND_TO_LLM, copy=False)
+        payload.sql = tree.sql(dialect=dialect)
 
     try:
 
@@ -399,12 +607,21 @@ def post_save_warehouse_prompt_session(
     orguser: OrgUser = request.orguser
     org = orguser.org
 
-    new_session = LlmSession.objects.filter(
-        session_id=new_session_id,
-        org=org,
-        session_type=LlmAssistantType.LONG_TEXT_SUMMARIZATION,
-    ).first()
+    # fetch the new session & the one to overwrite (if any) in a single query
+    session_ids = [new_session_id]
+    if payload.overwrite and payload.old_session_id:
+        session_ids.append(payload.old_session_id)
 
+    sessions = {
+        session.session_id: session
+        for session in LlmSession.objects.filter(
+            session_id__in=session_ids,
+            org=org,
+            session_type=LlmAssistantType.LONG_TEXT_SUMMARIZATION,
+        )
+    }
+
+    new_session = sessions.get(new_session_id)
     if not new_session:
         raise HttpError(404, "Session not found")
 
@@ -413,12 +630,8 @@ def post_save_warehouse_prompt_session(
 
     # delete the old session if overwrite is true
     if payload.overwrite:
-        old_session = LlmSession.objects.filter(
-            session_id=payload.old_session_id,
-            org=org,
-            session_type=LlmAssistantType.LONG_TEXT_SUMMARIZATION,
-        ).first()
-        if old_session:
+        old_session = sessions.get(payload.old_session_id)
+        if old_session and old_session.id != new_session.id:
             old_session.delete()
             logger.info(
                 f"Deleted the old session llm analysis {payload.old_session_id}"
@@ -470,42 +683,47 @@ def get_warehouse_llm_analysis_sessions(
     orguser: OrgUser = request.orguser
     org = orguser.org
 
-    sessions = (
-        LlmSession.objects.filter(
-            org=org,
-            session_name__isnull=False,  # fetch only saved sessions
-            session_type=LlmAssistantType.LONG_TEXT_SUMMARIZATION,
-        )
-        .select_related("orguser__user")
-        .order_by("-updated_at")[offset : offset + limit]
-    )
-
-    # can be optimized
-    total_count = LlmSession.objects.filter(
+    saved_sessions = LlmSession.objects.filter(
         org=org,
         session_name__isnull=False,  # fetch only saved sessions
         session_type=LlmAssistantType.LONG_TEXT_SUMMARIZATION,
-    ).count()
+    )
+
+    # the window count rides along with the page rows; saves a second count query
+    # rows are read as plain dicts; no model instances are needed for the response
+    rows = list(
+        saved_sessions.annotate(total_rows=Window(expression=Count("*")))
+        .order_by("-updated_at")
+        .values(
+            "session_id",
+            "session_name",
+            "session_status",
+            "request_uuid",
+            "request_meta",
+            "assistant_prompt",
+            "response",
+            "created_at",
+            "updated_at",
+            "orguser__user__email",
+            "total_rows",
+        )[offset : offset + limit]
+    )
+
+    if rows:
+        total_count = rows[0]["total_rows"]
+    elif offset > 0:
+        # paged past the end; the window count is not available
+        total_count = saved_sessions.count()
+    else:
+        total_count = 0
+
+    for row in rows:
+        del row["total_rows"]
+        row["created_by"] = {"email": row.pop("orguser__user__email")}
 
     return {
         "limit": limit,
         "offset": offset,
         "total_rows": total_count,
-        "rows": [
-            {
-                "session_id": session.session_id,
-                "session_name": session.session_name,
-                "session_status": session.session_status,
-                "request_uuid": session.request_uuid,
-                "request_meta": session.request_meta,
-                "assistant_prompt": session.assistant_prompt,
-                "response": session.response,
-                "created_at": session.created_at,
-                "updated_at": session.updated_at,
-                "created_by": {
-                    "email": session.orguser.user.email,
-                },
-            }
-            for session in sessions
-        ],
+        "rows": rows,
     }
@@ -17,6 +17,7 @@ from ddpui.utils.webhook_helpers import (
     FLOW_RUN,
 )
 from ddpui.utils.constants import SYSTEM_USER_EMAIL
+from ddpui.utils.warehouse_metadata_cache import clear_warehouse_metadata_cache
 from ddpui.ddpprefect import (
     FLOW_RUN_CANCELLED_STATE_NAME,
     FLOW_RUN_CRASHED_STATE_NAME,
@@ -145,6 +146,8 @@ def post_notification_v1(request):  # pylint: disable=unused-argument
     if state in [FLOW_RUN_COMPLETED_STATE_NAME]:
         org = get_org_from_flow_run(flow_run)
         if org:
+            # syncs & transforms may have added schemas, tables or columns
+            clear_warehouse_metadata_cache(org.id)
             email_orgusers_ses_whitelisted(org, "Your pipeline completed successfully")
 
     return {"status": "ok"}
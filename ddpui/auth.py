@@ -1,4 +1,6 @@
 from functools import wraps
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import OuterRef
 from ninja.security import HttpBearer
 from ninja.errors import HttpError
 
@@ -49,6 +51,8 @@ class PlatformAdmin(HttpBearer):
 
 
 def has_permission(permission_slugs: list):
+    required_permissions = frozenset(permission_slugs)
+
     def decorator(api_endpoint):
         @wraps(api_endpoint)
         def wrapper(*args, **kwargs):
@@ -60,7 +64,7 @@ def has_permission(permission_slugs: list):
                 if not request.permissions or len(request.permissions) == 0:
                     raise HttpError(403, "not allowed")
 
-                if not set(request.permissions).issuperset(set(permission_slugs)):
+                if not required_permissions.issubset(request.permissions):
                     raise HttpError(403, "not allowed")
             except:
                 raise HttpError(404, UNAUTHORIZED)
@@ -95,26 +99,31 @@ class CustomAuthMiddleware(HttpBearer):
     """new middleware that works based on permissions from db"""
 
     def authenticate(self, request, token):
-        tokenrecord = Token.objects.filter(key=token).first()
-        if tokenrecord and tokenrecord.user:
-            request.user = tokenrecord.user
-            q_orguser = OrgUser.objects.filter(user=request.user)
-            if request.headers.get("x-dalgo-org"):
-                orgslug = request.headers["x-dalgo-org"]
-                q_orguser = q_orguser.filter(org__slug=orgslug)
-            orguser = q_orguser.select_related("org", "user").first()
-            if orguser is not None:
-                if orguser.org is None:
-                    raise HttpError(400, "register an organization first")
-
-                permission_slugs = RolePermission.objects.filter(
-                    role=orguser.new_role
-                ).values_list("permission__slug", flat=True)
-
-                request.permissions = list(permission_slugs) or []
-                request.orguser = orguser
-                thread.set_current_request(request)
-                return request
+        # the token's orguser, its org, user & role permissions in a single query
+        q_orguser = OrgUser.objects.filter(user__auth_token__key=token)
+        if request.headers.get("x-dalgo-org"):
+            orgslug = request.headers["x-dalgo-org"]
+            q_orguser = q_orguser.filter(org__slug=orgslug)
+        orguser = (
+            q_orguser.select_related("org", "user")
+            .annotate(
+                permission_slugs=ArraySubquery(
+                    RolePermission.objects.filter(role=OuterRef("new_role")).values(
+                        "permission__slug"
+                    )
+                )
+            )
+            .first()
+        )
+        if orguser is not None:
+            request.user = orguser.user
+            if orguser.org is None:
+                raise HttpError(400, "register an organization first")
+
+            request.permissions = frozenset(orguser.permission_slugs)
+            request.orguser = orguser
+            thread.set_current_request(request)
+            return request
 
         raise HttpError(400, UNAUTHORIZED)
 
@@ -17,5 +17,13 @@ app = Celery('ddpui', backend=f'redis://{REDIS_HOST}:{REDIS_PORT}', broker=f'red
 #   should have a `CELERY_` prefix.
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
+# .delay() / apply_async borrow producers & connections from the broker pool;
+# keepalive stops idle pooled connections from being dropped & re-handshaked
+app.conf.update(
+    broker_pool_limit=10,
+    broker_transport_options={"socket_keepalive": True},
+    redis_socket_keepalive=True,
+)
+
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
@@ -1,19 +1,21 @@
 import sqlalchemy.types as types
-from sqlalchemy.engine import create_engine
 from sqlalchemy.engine.reflection import Inspector
 from sqlalchemy import inspect
 from sqlalchemy.types import NullType
+from sqlalchemy_bigquery import STRUCT
 from sqlalchemy_bigquery._types import _type_map
 
 from ddpui.datainsights.insights.insight_interface import MAP_TRANSLATE_TYPES
 from ddpui.datainsights.warehouse.warehouse_interface import Warehouse
 from ddpui.datainsights.warehouse.warehouse_interface import WarehouseType
+from ddpui.datainsights.warehouse.engine_cache import get_engine
 
 ### CAUTION: workaround for missing datatypes; complex queries on such types using sqlalchemy expression might fail
 _type_map["JSON"] = types.JSON
 
 
 class BigqueryClient(Warehouse):
+    json_column_types = Warehouse.json_column_types + (STRUCT,)
 
     def __init__(self, creds: dict):
         """
@@ -22,8 +24,9 @@ class BigqueryClient(Warehouse):
         """
         connection_string = "bigquery://{project_id}".format(**creds)
 
-        self.engine = create_engine(
-            connection_string, credentials_info=creds, pool_size=5, pool_timeout=30
+        # engines (and their connection pools) are shared across clients
+        self.engine = get_engine(
+            WarehouseType.BIGQUERY, creds, connection_string, credentials_info=creds
         )
         self.inspect_obj: Inspector = inspect(
             self.engine
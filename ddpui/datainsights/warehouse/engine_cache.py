@@ -0,0 +1,127 @@
+"""
+Process wide cache of sqlalchemy engines, one per set of warehouse credentials
+Each engine carries its own connection pool, so clients created for the same
+warehouse reuse connections instead of opening (and authenticating) new ones
+An engine may connect through an ssh tunnel, which lives & dies with the engine
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from sqlalchemy.engine import Engine, create_engine, make_url
+
+MAX_CACHED_ENGINES = 64
+
+_engines: OrderedDict = OrderedDict()
+_tunnels: dict = {}
+# guards the dicts only; engines (& tunnels) are built under a lock of their own key
+_engines_lock = threading.Lock()
+_key_locks: dict = {}
+
+
+def credentials_fingerprint(wtype: str, creds: dict) -> bytes:
+    """stable digest of the warehouse type & credentials; used as the cache key"""
+    canonical = json.dumps([wtype, creds], sort_keys=True, default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+
+def get_engine(
+    wtype: str, creds: dict, connection_string, open_tunnel=None, **kwargs
+) -> Engine:
+    """
+    Return the cached engine for these credentials, creating it if needed
+    The least recently used engine is disposed once the cache is full
+    open_tunnel, if given, returns a started ssh tunnel to the database; the engine then
+    connects to the tunnel's local end instead of the host & port in connection_string
+    """
+    key = credentials_fingerprint(wtype, creds)
+    with _engines_lock:
+        engine, stale = _lookup(key)
+        if engine is None:
+            key_lock = _key_locks.setdefault(key, threading.Lock())
+    _close(*stale)
+    if engine is not None:
+        return engine
+
+    # opening a tunnel can take a while; only callers for the same credentials wait
+    with key_lock:
+        try:
+            with _engines_lock:
+                engine, stale = _lookup(key)
+            _close(*stale)
+            if engine is not None:
+                return engine
+
+            url = make_url(connection_string)
+            tunnel = None
+            if open_tunnel is not None:
+                tunnel = open_tunnel()
+                url = url.set(host="127.0.0.1", port=tunnel.local_bind_port)
+            try:
+                engine = create_engine(
+                    url,
+                    pool_size=5,
+                    pool_timeout=30,
+                    pool_pre_ping=True,
+                    pool_recycle=1800,
+                    **kwargs,
+                )
+            except Exception:
+                _close(None, tunnel)
+                raise
+
+            evicted = (None, None)
+            with _engines_lock:
+                if key in _engines:
+                    # a caller holding an older key lock got there first; use theirs
+                    evicted, engine = (engine, tunnel), _engines[key]
+                else:
+                    _engines[key] = engine
+                    if tunnel is not None:
+                        _tunnels[key] = tunnel
+                    if len(_engines) > MAX_CACHED_ENGINES:
+                        evicted = _pop(next(iter(_engines)))
+            _close(*evicted)
+            return engine
+        finally:
+            with _engines_lock:
+                _key_locks.pop(key, None)
+
+
+def _lookup(key: bytes) -> tuple:
+    """
+    the cached engine for the key (or None), and what to close if its tunnel went down
+    call with _engines_lock held
+    """
+    engine = _engines.get(key)
+    if engine is None:
+        return None, (None, None)
+    tunnel = _tunnels.get(key)
+    if tunnel is not None and not tunnel.is_active:
+        # the tunnel went down; the caller starts over with a new one
+        return None, _pop(key)
+    _engines.move_to_end(key)
+    return engine, (None, None)
+
+
+def _pop(key: bytes) -> tuple:
+    """forget an engine & its tunnel; call with _engines_lock held"""
+    return _engines.pop(key), _tunnels.pop(key, None)
+
+
+def _close(engine, tunnel) -> None:
+    """dispose an engine & stop its tunnel, either of which may be None"""
+    if engine is not None:
+        engine.dispose()
+    if tunnel is not None:
+        tunnel.stop()
+
+
+def dispose_engines() -> None:
+    """dispose & forget all cached engines"""
+    with _engines_lock:
+        popped = [_pop(key) for key in list(_engines)]
+    for engine, tunnel in popped:
+        _close(engine, tunnel)
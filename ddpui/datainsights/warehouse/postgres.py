@@ -1,4 +1,9 @@
-from sqlalchemy.engine import create_engine
+import tempfile
+from functools import partial
+
+from psycopg2 import sql
+from sshtunnel import SSHTunnelForwarder
+from sqlalchemy.engine import URL
 from sqlalchemy.engine.reflection import Inspector
 from sqlalchemy import inspect
 from sqlalchemy.types import NullType
@@ -6,6 +11,12 @@ from sqlalchemy.types import NullType
 from ddpui.datainsights.insights.insight_interface import MAP_TRANSLATE_TYPES
 from ddpui.datainsights.warehouse.warehouse_interface import Warehouse
 from ddpui.datainsights.warehouse.warehouse_interface import WarehouseType
+from ddpui.datainsights.warehouse.engine_cache import get_engine
+from ddpui.utils.helpers import map_airbyte_keys_to_postgres_keys
+
+# verify-ca & verify-full need the certificates from the airbyte config on disk; the
+# client leaves those to libpq's default (prefer) rather than fail to connect
+SSL_MODES_WITHOUT_FILES = ("disable", "allow", "prefer", "require")
 
 
 class PostgresClient(Warehouse):
@@ -13,17 +24,67 @@ class PostgresClient(Warehouse):
     def __init__(self, creds: dict):
         """
         Establish connection to the postgres database using sqlalchemy engine
-        Creds come from the secrets manager
+        Creds come from the secrets manager, in airbyte's format; the port, ssl_mode and
+        tunnel_method in them are honoured
         """
-        connection_string = (
-            "postgresql://{username}:{password}@{host}/{database}".format(**creds)
+        conn_info = map_airbyte_keys_to_postgres_keys(dict(creds))
+        connection_url = URL.create(
+            "postgresql",
+            username=conn_info["user"],
+            password=conn_info["password"],
+            host=conn_info["host"],
+            port=int(conn_info.get("port") or 5432),
+            database=conn_info["database"],
         )
 
-        self.engine = create_engine(connection_string, pool_size=5, pool_timeout=30)
+        connect_args = {}
+        ssl_mode = conn_info.get("ssl_mode")
+        if (
+            isinstance(ssl_mode, dict)
+            and ssl_mode.get("mode") in SSL_MODES_WITHOUT_FILES
+        ):
+            connect_args["sslmode"] = ssl_mode["mode"]
+
+        open_tunnel = None
+        if "ssh_host" in conn_info:
+            open_tunnel = partial(self._open_ssh_tunnel, conn_info)
+
+        # engines (and their connection pools) are shared across clients
+        self.engine = get_engine(
+            WarehouseType.POSTGRES,
+            creds,
+            connection_url,
+            open_tunnel=open_tunnel,
+            connect_args=connect_args,
+        )
         self.inspect_obj: Inspector = inspect(
             self.engine
         )  # this will be used to fetch metadata of the database
 
+    @staticmethod
+    def _open_ssh_tunnel(conn_info: dict) -> SSHTunnelForwarder:
+        """start an ssh tunnel to the database, authenticating with a key or a password"""
+        with tempfile.NamedTemporaryFile("w") as pkey_file:
+            ssh_pkey = None
+            if conn_info.get("ssh_pkey"):
+                # sshtunnel reads (and works out the type of) the key from a file
+                pkey_file.write(conn_info["ssh_pkey"])
+                pkey_file.flush()
+                ssh_pkey = pkey_file.name
+            tunnel = SSHTunnelForwarder(
+                (conn_info["ssh_host"], int(conn_info["ssh_port"])),
+                ssh_username=conn_info["ssh_username"],
+                ssh_password=conn_info.get("ssh_password"),
+                ssh_pkey=ssh_pkey,
+                ssh_private_key_password=conn_info.get("ssh_private_key_password"),
+                remote_bind_address=(
+                    conn_info["host"],
+                    int(conn_info.get("port") or 5432),
+                ),
+            )
+        tunnel.start()
+        return tunnel
+
     def execute(self, sql) -> list[dict]:
         """
         Execute the sql query and return the results
@@ -63,3 +124,23 @@ class PostgresClient(Warehouse):
 
     def get_wtype(self):
         return WarehouseType.POSTGRES
+
+    def copy_table_to_csv(self, db_schema: str, db_table: str, sink, batch_size=30000):
+        """
+        Postgres formats the csv itself via COPY ... TO STDOUT; no rows are built in python
+        batch_size is not used, the server streams the copy
+        """
+        connection = self.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                # copying from a query also covers views & partitioned tables
+                statement = sql.SQL(
+                    "COPY (SELECT * FROM {}.{}) TO STDOUT WITH CSV HEADER"
+                ).format(sql.Identifier(db_schema), sql.Identifier(db_table))
+                cursor.copy_expert(statement, sink)
+        except Exception:
+            # an interrupted copy can leave the connection mid-protocol
+            connection.invalidate()
+            raise
+        finally:
+            connection.close()
@@ -1,6 +1,14 @@
+import csv
+import io
 from abc import ABC, abstractmethod
 from enum import Enum
 
+import sqlalchemy.types as types
+from sqlalchemy import select, table
+from sqlalchemy.sql.expression import ColumnClause
+
+from ddpui.utils.helpers import dump_json_cells
+
 
 class WarehouseType(str, Enum):
     """
@@ -12,6 +20,8 @@ class WarehouseType(str, Enum):
 
 
 class Warehouse(ABC):
+    # columns of these types are dumped to json strings when rows are streamed
+    json_column_types: tuple = (types.JSON, types.ARRAY)
 
     @abstractmethod
     def execute(self, sql_statement: str):
@@ -28,3 +38,48 @@ class Warehouse(ABC):
     @abstractmethod
     def get_wtype(self):
         pass
+
+    def stream_table_rows(self, db_schema: str, db_table: str, batch_size: int):
+        """
+        Stream all rows of a table over a single server side cursor
+        Returns the column names and an iterator over batches of row tuples
+        json / array values are dumped to json strings so that the rows are flat
+        """
+        columns = self.inspect_obj.get_columns(table_name=db_table, schema=db_schema)
+        json_indexes = [
+            index
+            for index, col in enumerate(columns)
+            if isinstance(col["type"], self.json_column_types)
+        ]
+        statement = select(*[ColumnClause(col["name"]) for col in columns]).select_from(
+            table(db_table, schema=db_schema)
+        )
+        return [col["name"] for col in columns], self._stream_batches(
+            statement, batch_size, json_indexes
+        )
+
+    def _stream_batches(self, statement, batch_size: int, json_indexes: list[int]):
+        """yield batches of rows of a streamed query"""
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(
+                statement
+            )
+            for partition in result.partitions(batch_size):
+                yield dump_json_cells(partition, json_indexes)
+
+    def copy_table_to_csv(self, db_schema: str, db_table: str, sink, batch_size=30000):
+        """
+        writes the table to sink (anything with a write(bytes)) as utf-8 csv with a header
+        clients that can have the database produce the csv override this
+        """
+        columns, batches = self.stream_table_rows(db_schema, db_table, batch_size)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(columns)
+        for batch in batches:
+            writer.writerows(batch)
+            sink.write(buffer.getvalue().encode("utf-8"))
+            buffer.seek(0)
+            buffer.truncate(0)
+        if buffer.tell():  # no rows, only the header
+            sink.write(buffer.getvalue().encode("utf-8"))
@@ -0,0 +1,20 @@
+# Generated by Django 4.2 on 2026-10-15 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ddpui", "0100_llmsession_feedback"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="llmsession",
+            index=models.Index(
+                condition=models.Q(("session_name__isnull", False)),
+                fields=["org", "session_type", "-updated_at"],
+                name="llmsession_list_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-15 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ddpui", "0101_llmsession_llmsession_list_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="llmsession",
+            index=models.Index(
+                fields=["session_id", "org", "session_type"],
+                name="llmsession_session_id_idx",
+            ),
+        ),
+    ]
@@ -75,6 +75,21 @@ class LlmSession(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     feedback = models.TextField(null=True)
 
+    class Meta:
+        indexes = [
+            # serves the saved sessions listing; filter + order by in one index scan
+            models.Index(
+                fields=["org", "session_type", "-updated_at"],
+                name="llmsession_list_idx",
+                condition=models.Q(session_name__isnull=False),
+            ),
+            # session lookups by id when saving / giving feedback
+            models.Index(
+                fields=["session_id", "org", "session_type"],
+                name="llmsession_session_id_idx",
+            ),
+        ]
+
 
 class UserPrompt(models.Model):
     """System defined user prompts for various assistant/services"""
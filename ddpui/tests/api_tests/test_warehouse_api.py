@@ -1,5 +1,9 @@
+import gzip
+import json
+import threading
+import time
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 from ninja.errors import HttpError
 import sqlalchemy
 from unittest.mock import _Call
@@ -24,6 +28,10 @@ from ddpui.api.warehouse_api import (
     get_warehouse_table_columns_spec,
     post_warehouse_prompt,
     post_save_warehouse_prompt_session,
+    get_warehouse_llm_analysis_sessions,
+    get_org_warehouse,
+    stream_table_csv,
+    accepts_gzip_encoding,
 )
 from ddpui.schemas.warehouse_api_schemas import (
     RequestorColumnSchema,
@@ -55,6 +63,27 @@ def test_seed_data(seed_db):
     assert Permission.objects.count() > 5
 
 
+def test_get_org_warehouse_is_shared_across_requests(
+    orguser, django_assert_num_queries
+):
+    """the warehouse is looked up once per org until it is saved again"""
+    assert get_org_warehouse(mock_request(orguser)) is None
+    warehouse = OrgWarehouse.objects.create(
+        org=orguser.org, name="fake-warehouse-name", wtype="postgres"
+    )
+
+    assert get_org_warehouse(mock_request(orguser)) == warehouse
+    with django_assert_num_queries(0):
+        assert get_org_warehouse(mock_request(orguser)) == warehouse
+
+    warehouse.wtype = "bigquery"
+    warehouse.save()
+    assert get_org_warehouse(mock_request(orguser)).wtype == "bigquery"
+
+    warehouse.delete()
+    assert get_org_warehouse(mock_request(orguser)) is None
+
+
 @patch.multiple(
     "ddpui.api.warehouse_api",
     get_warehouse_data=Mock(return_value=["table1", "table2"]),
@@ -94,6 +123,72 @@ def test_get_table_columns_success(orguser):
     assert response == ["column1", "column2"]
 
 
+def test_get_table_columns_served_from_cache(orguser):
+    """the second lookup is served from redis without touching the warehouse"""
+    warehouse = OrgWarehouse.objects.create(
+        org=orguser.org, name="fake-warehouse-name", wtype="postgres"
+    )
+    redis = Mock()
+    redis.get.return_value = None
+
+    with patch(
+        "ddpui.utils.warehouse_metadata_cache.RedisClient.get_instance",
+        return_value=redis,
+    ), patch(
+        "ddpui.api.warehouse_api.get_warehouse_data",
+        return_value=["column1", "column2"],
+    ) as get_warehouse_data_mock:
+        request = mock_request(orguser)
+        assert get_table_columns(request, "test_schema", "test_table") == [
+            "column1",
+            "column2",
+        ]
+        key = (
+            f"whmeta:{orguser.org.id}:postgres:get_table_columns:{warehouse.id}:"
+            f"{warehouse.updated_at.timestamp()}:test_schema:test_table"
+        )
+        redis.set.assert_called_once_with(key, '["column1", "column2"]', ex=60)
+
+        redis.get.return_value = b'["column1", "column2"]'
+        request = mock_request(orguser)
+        assert get_table_columns(request, "test_schema", "test_table") == [
+            "column1",
+            "column2",
+        ]
+        redis.get.assert_called_with(key)
+        get_warehouse_data_mock.assert_called_once()
+
+
+def test_get_table_columns_cache_missed_after_warehouse_update(orguser):
+    """an updated warehouse does not serve the columns cached before the update"""
+    warehouse = OrgWarehouse.objects.create(
+        org=orguser.org, name="fake-warehouse-name", wtype="postgres"
+    )
+    store = {}
+    redis = Mock()
+    redis.get.side_effect = store.get
+    redis.set.side_effect = lambda key, value, ex: store.update({key: value})
+
+    with patch(
+        "ddpui.utils.warehouse_metadata_cache.RedisClient.get_instance",
+        return_value=redis,
+    ), patch(
+        "ddpui.api.warehouse_api.get_warehouse_data",
+        side_effect=[["column1"], ["column1", "column2"]],
+    ) as get_warehouse_data_mock:
+        assert get_table_columns(
+            mock_request(orguser), "test_schema", "test_table"
+        ) == ["column1"]
+
+        warehouse.name = "renamed-warehouse"
+        warehouse.save()
+
+        assert get_table_columns(
+            mock_request(orguser), "test_schema", "test_table"
+        ) == ["column1", "column2"]
+        assert get_warehouse_data_mock.call_count == 2
+
+
 @patch.multiple(
     "ddpui.api.warehouse_api",
     get_warehouse_data=Mock(
@@ -107,7 +202,11 @@ def test_get_table_data_success(orguser):
     response = get_table_data(request, schema_name, table_name)
 
     assert response is not None
-    assert response == [{"column_1": "value_1"}, {"column2": "value2}"}]
+    assert response["Content-Type"] == "application/json"
+    assert json.loads(response.content) == [
+        {"column_1": "value_1"},
+        {"column2": "value2}"},
+    ]
 
 
 def test_data_insights_without_warehouse(orguser, data_insights_payload):
@@ -165,30 +264,171 @@ def test_download_warehouse_data_success(orguser):
 
     OrgWarehouse.objects.create(org=orguser.org, name="fake-warehouse-name")
 
-    # mock generator function
-    mock_page1 = [
-        {"col1": "value1", "col2": "value2"},
-        {"col1": "value3", "col2": "value4"},
-    ]
-    mock_page2 = [{"col1": "value5", "col2": "value6"}]
-    mock_page3 = []
-    mock_db_pagination = [mock_page1, mock_page2, mock_page3]
+    def copy_table_to_csv(schema_name, table_name, sink):
+        # the client writes the csv to the sink
+        sink.write(b"col1,col2\n")
+        sink.write(b"value1,value2\nvalue3,value4\n")
+        sink.write(b"value5,value6\n")
 
     with patch(
-        "ddpui.api.warehouse_api.get_warehouse_data", side_effect=mock_db_pagination
-    ):
+        "ddpui.utils.secretsmanager.retrieve_warehouse_credentials",
+        return_value={"some-creds": "some-value"},
+    ), patch(
+        "ddpui.datainsights.warehouse.warehouse_factory.WarehouseFactory.connect"
+    ) as mock_wclient:
+        mock_wclient.return_value.copy_table_to_csv.side_effect = copy_table_to_csv
         request = mock_request(orguser)
+        request.headers = {}
         response = get_download_warehouse_data(request, "test_schema", "test_table")
+        assert not response.has_header("Content-Encoding")
 
         # check response
         content = b"".join(response.streaming_content).decode("utf-8")
 
-        # Assertions to verify the streaming response content
-        assert "col1,col2\n" in content  # Check header
-        assert "value1,value2\n" in content  # Check first row
-        assert "value3,value4\n" in content  # Check second row
-        assert "value5,value6\n" in content  # Check second row
-        assert content.count("\n") == 4
+        assert content == "col1,col2\nvalue1,value2\nvalue3,value4\nvalue5,value6\n"
+        mock_wclient.return_value.copy_table_to_csv.assert_called_once_with(
+            "test_schema", "test_table", ANY
+        )
+
+
+def test_download_warehouse_data_gzipped(orguser):
+    """The csv is gzipped for clients that accept it"""
+
+    OrgWarehouse.objects.create(org=orguser.org, name="fake-warehouse-name")
+
+    def copy_table_to_csv(schema_name, table_name, sink):
+        sink.write(b"col1,col2\n")
+        sink.write(b"value1,value2\n" * 1000)
+
+    with patch(
+        "ddpui.utils.secretsmanager.retrieve_warehouse_credentials",
+        return_value={"some-creds": "some-value"},
+    ), patch(
+        "ddpui.datainsights.warehouse.warehouse_factory.WarehouseFactory.connect"
+    ) as mock_wclient:
+        mock_wclient.return_value.copy_table_to_csv.side_effect = copy_table_to_csv
+        request = mock_request(orguser)
+        request.headers = {"Accept-Encoding": "gzip, deflate, br"}
+        response = get_download_warehouse_data(request, "test_schema", "test_table")
+
+        assert response["Content-Encoding"] == "gzip"
+        assert response["Vary"] == "Accept-Encoding"
+        content = b"".join(response.streaming_content)
+        assert len(content) < 1000
+        assert gzip.decompress(content) == b"col1,col2\n" + b"value1,value2\n" * 1000
+
+
+def test_download_warehouse_data_not_gzipped_when_refused(orguser):
+    """gzip;q=0 refuses gzip, even though the header mentions it"""
+
+    OrgWarehouse.objects.create(org=orguser.org, name="fake-warehouse-name")
+
+    def copy_table_to_csv(schema_name, table_name, sink):
+        sink.write(b"col1,col2\nvalue1,value2\n")
+
+    with patch(
+        "ddpui.utils.secretsmanager.retrieve_warehouse_credentials",
+        return_value={"some-creds": "some-value"},
+    ), patch(
+        "ddpui.datainsights.warehouse.warehouse_factory.WarehouseFactory.connect"
+    ) as mock_wclient:
+        mock_wclient.return_value.copy_table_to_csv.side_effect = copy_table_to_csv
+        request = mock_request(orguser)
+        request.headers = {"Accept-Encoding": "gzip;q=0, identity"}
+        response = get_download_warehouse_data(request, "test_schema", "test_table")
+
+        assert not response.has_header("Content-Encoding")
+        assert response["Vary"] == "Accept-Encoding"
+        assert b"".join(response.streaming_content) == b"col1,col2\nvalue1,value2\n"
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected",
+    [
+        ("", False),
+        ("gzip", True),
+        ("deflate, GZIP;q=0.5", True),
+        ("gzip;q=0", False),
+        ("gzip ; q=0.0, br", False),
+        ("x-gzip2, br", False),
+        ("*", True),
+        ("*;q=0", False),
+        ("gzip;q=0, *", False),
+        ("gzip;q=bogus", False),
+    ],
+)
+def test_accepts_gzip_encoding(accept_encoding, expected):
+    """q-values are honoured; an explicit gzip entry wins over *"""
+    assert accepts_gzip_encoding(accept_encoding) is expected
+
+
+def test_download_warehouse_data_copy_failed(orguser):
+    """A failing copy ends the stream with the error"""
+
+    OrgWarehouse.objects.create(org=orguser.org, name="fake-warehouse-name")
+
+    with patch(
+        "ddpui.utils.secretsmanager.retrieve_warehouse_credentials",
+        return_value={"some-creds": "some-value"},
+    ), patch(
+        "ddpui.datainsights.warehouse.warehouse_factory.WarehouseFactory.connect"
+    ) as mock_wclient:
+        mock_wclient.return_value.copy_table_to_csv.side_effect = (
+            sqlalchemy.exc.OperationalError("COPY", {}, "connection lost")
+        )
+        request = mock_request(orguser)
+        request.headers = {}
+        response = get_download_warehouse_data(request, "test_schema", "test_table")
+
+        with pytest.raises(sqlalchemy.exc.OperationalError):
+            b"".join(response.streaming_content)
+
+
+def test_stream_table_csv_stops_copy_when_abandoned():
+    """Closing the stream early stops the copy running in the background"""
+    copy_stopped = threading.Event()
+
+    def copy_table_to_csv(schema_name, table_name, sink):
+        try:
+            while True:
+                sink.write(b"value1,value2\n")
+        finally:
+            copy_stopped.set()
+
+    wclient = Mock()
+    wclient.copy_table_to_csv.side_effect = copy_table_to_csv
+    stream = stream_table_csv(wclient, "test_schema", "test_table", chunk_size=1)
+    assert next(stream) == b"value1,value2\n"
+    stream.close()
+
+    assert copy_stopped.wait(timeout=5)
+
+
+def test_get_warehouse_table_columns_spec_served_from_catalog(orguser):
+    """Column specs already in the catalog are returned without connecting to the warehouse"""
+
+    warehouse = OrgWarehouse.objects.create(
+        org=orguser.org, name="fake-warehouse-name", wtype="postgres"
+    )
+    redis = Mock()
+    redis.get.return_value = b'[{"name": "col1", "data_type": "int"}]'
+
+    with patch(
+        "ddpui.utils.warehouse_metadata_cache.RedisClient.get_instance",
+        return_value=redis,
+    ), patch(
+        "ddpui.datainsights.warehouse.warehouse_factory.WarehouseFactory.connect",
+    ) as mock_wclient:
+        request = mock_request(orguser)
+        response = get_warehouse_table_columns_spec(
+            request, "test_schema", "test_table"
+        )
+        assert response == [{"name": "col1", "data_type": "int"}]
+        redis.get.assert_called_once_with(
+            f"whmeta:{orguser.org.id}:postgres:column_catalog:{warehouse.id}:"
+            f"{warehouse.updated_at.timestamp()}:test_schema:test_table"
+        )
+        mock_wclient.assert_not_called()
 
 
 def test_get_warehouse_table_columns_spec_without_warehouse(orguser):
@@ -272,6 +512,10 @@ def test_llm_data_analysis_invalid_sqls(orguser):
     """
     Test cases for llm data analysis with invalid sql
     """
+    OrgWarehouse.objects.create(
+        org=orguser.org, name="fake-warehouse-name", wtype="postgres"
+    )
+
     # only select queries allowed
     payload = AskWarehouseRequest(
         sql="update some_table set col1 = null where 1 = 1",
@@ -305,6 +549,64 @@ def test_llm_data_analysis_invalid_sqls(orguser):
     assert exc.value.status_code == 400
     assert str(exc.value) == "No query provided"
 
+    # only comments
+    payload = AskWarehouseRequest(
+        sql="-- select * from some_table\n/* nothing to run */",
+        user_prompt="Summarize the output",
+    )
+    with pytest.raises(HttpError) as exc:
+        request = mock_request(orguser)
+        post_warehouse_prompt(request, payload)
+    assert exc.value.status_code == 400
+    assert str(exc.value) == "No query provided"
+
+    # writes hidden in a cte
+    payload = AskWarehouseRequest(
+        sql="with d as (delete from some_table returning *) select * from d",
+        user_prompt="Summarize the output",
+    )
+    with pytest.raises(HttpError) as exc:
+        request = mock_request(orguser)
+        post_warehouse_prompt(request, payload)
+    assert exc.value.status_code == 400
+    assert str(exc.value) == "Only SELECT queries are allowed"
+
+    # sql that does not parse
+    payload = AskWarehouseRequest(
+        sql="select 'unterminated from some_table",
+        user_prompt="Summarize the output",
+    )
+    with pytest.raises(HttpError) as exc:
+        request = mock_request(orguser)
+        post_warehouse_prompt(request, payload)
+    assert exc.value.status_code == 400
+    assert str(exc.value) == "Unable to parse the query"
+
+
+def test_llm_data_analysis_rejects_hostile_sql_quickly(orguser):
+    """
+    Comment runs that could make the select check backtrack are rejected right away
+    """
+    OrgWarehouse.objects.create(
+        org=orguser.org, name="fake-warehouse-name", wtype="postgres"
+    )
+
+    for sql in [
+        "-- " * 18 + "\nx",
+        "-- " * 2000 + "\nx",
+        "# " * 2000 + "\nx",
+        "/**/" * 5000 + "x",
+        "/* a */ x */ select 1",
+    ]:
+        payload = AskWarehouseRequest(sql=sql, user_prompt="Summarize the output")
+        start = time.monotonic()
+        with pytest.raises(HttpError) as exc:
+            request = mock_request(orguser)
+            post_warehouse_prompt(request, payload)
+        assert time.monotonic() - start < 1
+        assert exc.value.status_code == 400
+        assert str(exc.value) == "Only SELECT queries are allowed"
+
 
 def test_llm_data_analysis_limit_records_sent_to_llm(orguser):
     """
@@ -347,7 +649,39 @@ def test_llm_data_analysis_limit_records_sent_to_llm(orguser):
 
         assert (
             call_kwargs.get("kwargs", {}).get("sql", None)
-            == f"{sql} LIMIT {LIMIT_ROWS_TO_SEND_TO_LLM}"
+            == f"SELECT * FROM some_table LIMIT {LIMIT_ROWS_TO_SEND_TO_LLM}"
+        )
+
+
+def test_llm_data_analysis_sql_with_literals_and_comments(orguser):
+    """
+    Semicolons / keywords inside literals & comments should not trip the sql checks
+    """
+    OrgWarehouse.objects.create(org=orguser.org, name="fake-warehouse-name")
+
+    with patch(
+        "ddpui.celeryworkers.tasks.summarize_warehouse_results.apply_async",
+        return_value=Mock(id="task-id"),
+    ) as mock_apply_async:
+        request = mock_request(orguser)
+
+        # limit already present at the end of the query; sql is sent as is
+        sql = "select 'a;b' as col from some_table /* limit 100000 */ limit 10;"
+        post_warehouse_prompt(
+            request, AskWarehouseRequest(sql=sql, user_prompt="Summarize the output")
+        )
+        _, call_kwargs = list(mock_apply_async.call_args)
+        assert call_kwargs["kwargs"]["sql"] == sql
+
+        # trailing line comment; the limit is added to the query, not the comment
+        sql = "select * from some_table -- all rows"
+        post_warehouse_prompt(
+            request, AskWarehouseRequest(sql=sql, user_prompt="Summarize the output")
+        )
+        _, call_kwargs = list(mock_apply_async.call_args)
+        assert (
+            call_kwargs["kwargs"]["sql"]
+            == f"SELECT * FROM some_table /* all rows */ LIMIT {LIMIT_ROWS_TO_SEND_TO_LLM}"
         )
 
 
@@ -424,3 +758,36 @@ def test_llm_data_analysis_save_and_overwrite_session(orguser):
         ).count()
         == 1
     )
+
+
+def test_get_warehouse_llm_analysis_sessions(orguser):
+    """
+    Only saved sessions are listed; total_rows covers the full filtered set
+    """
+    request = mock_request(orguser)
+    for i in range(3):
+        LlmSession.objects.create(
+            session_id=f"saved-session-{i}",
+            org=orguser.org,
+            orguser=orguser,
+            session_status=LlmSessionStatus.COMPLETED,
+            session_type=LlmAssistantType.LONG_TEXT_SUMMARIZATION,
+            session_name=f"saved session {i}",
+        )
+    LlmSession.objects.create(
+        session_id="unsaved-session",
+        org=orguser.org,
+        orguser=orguser,
+        session_status=LlmSessionStatus.COMPLETED,
+        session_type=LlmAssistantType.LONG_TEXT_SUMMARIZATION,
+    )
+
+    response = get_warehouse_llm_analysis_sessions(request, limit=2, offset=0)
+    assert response["total_rows"] == 3
+    assert len(response["rows"]) == 2
+    assert response["rows"][0]["created_by"]["email"] == orguser.user.email
+
+    # paging past the end still reports the total
+    response = get_warehouse_llm_analysis_sessions(request, limit=2, offset=10)
+    assert response["total_rows"] == 3
+    assert response["rows"] == []
@@ -1,3 +1,4 @@
+import io
 import os
 import django
 from django.core.management import call_command
@@ -9,6 +10,8 @@ django.setup()
 
 
 import pytest
+from unittest.mock import Mock, MagicMock
+import sqlalchemy.types as types
 
 pytestmark = pytest.mark.django_db
 
@@ -37,6 +40,11 @@ class DummyWarehouse(Warehouse):
     def get_wtype(self):
         pass
 
+    def stream_table_rows(self, db_schema: str, db_table: str, batch_size: int):
+        return ["col1", "col2", "col3"], iter(
+            [[("a,b", 'say "hi"', "line1\nline2")], [(1, None, 2.5)]]
+        )
+
 
 def test_unimplemented_methods_warehouse_interface():
     """Each warehouse client should implement all abstract methods in Warehouse interface"""
@@ -53,3 +61,41 @@ def test_dummy_warehouse_with_all_methods_implemented():
     assert "get_col_python_type" in dir(obj)
     assert "get_table_columns" in dir(obj)
     assert "get_wtype" in dir(obj)
+    assert "stream_table_rows" in dir(obj)
+
+
+def test_default_copy_table_to_csv():
+    """The default csv copy writes a header & quotes values where needed"""
+    sink = io.BytesIO()
+    DummyWarehouse().copy_table_to_csv("test_schema", "test_table", sink)
+
+    assert sink.getvalue() == (
+        b'col1,col2,col3\n"a,b","say ""hi""","line1\nline2"\n1,,2.5\n'
+    )
+
+
+def test_stream_table_rows_dumps_json_columns():
+    """The shared row stream json-dumps only the json / array columns"""
+    warehouse = DummyWarehouse()
+    warehouse.inspect_obj = Mock()
+    warehouse.inspect_obj.get_columns.return_value = [
+        {"name": "id", "type": types.Integer()},
+        {"name": "tags", "type": types.ARRAY(types.String())},
+        {"name": "payload", "type": types.JSON()},
+    ]
+    result = Mock()
+    result.partitions.return_value = iter([[(1, ["a"], {"k": 1})], [(2, None, {})]])
+    connection = Mock()
+    connection.execution_options.return_value.execute.return_value = result
+    warehouse.engine = Mock()
+    warehouse.engine.connect.return_value = MagicMock(
+        __enter__=Mock(return_value=connection), __exit__=Mock(return_value=False)
+    )
+
+    columns, batches = Warehouse.stream_table_rows(
+        warehouse, "test_schema", "test_table", 100
+    )
+
+    assert columns == ["id", "tags", "payload"]
+    assert list(batches) == [[[1, '["a"]', '{"k": 1}']], [[2, None, {}]]]
+    result.partitions.assert_called_once_with(100)
@@ -0,0 +1,131 @@
+import os
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ddpui.settings")
+os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
+django.setup()
+
+
+import threading
+import time
+from unittest.mock import patch, Mock
+
+from ddpui.datainsights.warehouse import engine_cache
+from ddpui.datainsights.warehouse.engine_cache import (
+    credentials_fingerprint,
+    get_engine,
+    dispose_engines,
+)
+
+
+def test_credentials_fingerprint_is_stable():
+    """Key order of the credentials should not change the fingerprint"""
+    assert credentials_fingerprint(
+        "postgres", {"host": "h", "port": 5432}
+    ) == credentials_fingerprint("postgres", {"port": 5432, "host": "h"})
+    assert credentials_fingerprint(
+        "postgres", {"host": "h"}
+    ) != credentials_fingerprint("bigquery", {"host": "h"})
+
+
+def test_get_engine_reuses_engine_for_same_credentials():
+    """Same credentials share an engine; different credentials get their own"""
+    dispose_engines()
+    with patch(
+        "ddpui.datainsights.warehouse.engine_cache.create_engine",
+        side_effect=lambda *args, **kwargs: Mock(),
+    ) as mock_create_engine:
+        engine1 = get_engine("postgres", {"host": "h1"}, "postgresql://h1")
+        engine2 = get_engine("postgres", {"host": "h1"}, "postgresql://h1")
+        engine3 = get_engine("postgres", {"host": "h2"}, "postgresql://h2")
+
+        assert engine1 is engine2
+        assert engine1 is not engine3
+        assert mock_create_engine.call_count == 2
+    dispose_engines()
+
+
+def test_get_engine_evicts_least_recently_used():
+    """The least recently used engine is disposed when the cache is full"""
+    dispose_engines()
+    with patch(
+        "ddpui.datainsights.warehouse.engine_cache.create_engine",
+        side_effect=lambda *args, **kwargs: Mock(),
+    ), patch.object(engine_cache, "MAX_CACHED_ENGINES", 2):
+        engine1 = get_engine("postgres", {"host": "h1"}, "postgresql://h1")
+        get_engine("postgres", {"host": "h2"}, "postgresql://h2")
+        get_engine("postgres", {"host": "h3"}, "postgresql://h3")
+
+        engine1.dispose.assert_called_once()
+        assert len(engine_cache._engines) == 2
+    dispose_engines()
+
+
+def test_get_engine_connects_through_tunnel_and_stops_it_on_dispose():
+    """The engine connects to the tunnel's local end; the tunnel goes with the engine"""
+    dispose_engines()
+    tunnel = Mock(local_bind_port=40001, is_active=True)
+    open_tunnel = Mock(return_value=tunnel)
+    with patch(
+        "ddpui.datainsights.warehouse.engine_cache.create_engine",
+        side_effect=lambda *args, **kwargs: Mock(),
+    ) as mock_create_engine:
+        get_engine("postgres", {"host": "h1"}, "postgresql://u@h1:6543/db", open_tunnel)
+        get_engine("postgres", {"host": "h1"}, "postgresql://u@h1:6543/db", open_tunnel)
+
+        open_tunnel.assert_called_once()
+        url = mock_create_engine.call_args.args[0]
+        assert (url.host, url.port) == ("127.0.0.1", 40001)
+
+        dispose_engines()
+        tunnel.stop.assert_called_once()
+
+
+def test_get_engine_replaces_engine_when_tunnel_is_down():
+    """A dead tunnel takes its engine with it; the next call opens a fresh one"""
+    dispose_engines()
+    dead_tunnel = Mock(local_bind_port=40001, is_active=False)
+    open_tunnel = Mock(side_effect=[dead_tunnel, Mock(local_bind_port=40002)])
+    with patch(
+        "ddpui.datainsights.warehouse.engine_cache.create_engine",
+        side_effect=lambda *args, **kwargs: Mock(),
+    ):
+        engine1 = get_engine("postgres", {"host": "h1"}, "postgresql://h1", open_tunnel)
+        engine2 = get_engine("postgres", {"host": "h1"}, "postgresql://h1", open_tunnel)
+
+        assert engine1 is not engine2
+        engine1.dispose.assert_called_once()
+        dead_tunnel.stop.assert_called_once()
+    dispose_engines()
+
+
+def test_slow_tunnel_does_not_block_other_credentials():
+    """Opening a tunnel holds up only the callers for the same credentials"""
+    dispose_engines()
+    opening = threading.Event()
+    release = threading.Event()
+
+    def open_slow_tunnel():
+        opening.set()
+        release.wait(5)
+        return Mock(local_bind_port=40001, is_active=True)
+
+    with patch(
+        "ddpui.datainsights.warehouse.engine_cache.create_engine",
+        side_effect=lambda *args, **kwargs: Mock(),
+    ):
+        slow = threading.Thread(
+            target=get_engine,
+            args=("postgres", {"host": "h1"}, "postgresql://h1", open_slow_tunnel),
+        )
+        slow.start()
+        assert opening.wait(5)
+
+        started = time.monotonic()
+        get_engine("postgres", {"host": "h2"}, "postgresql://h2")
+        assert time.monotonic() - started < 1
+
+        release.set()
+        slow.join(5)
+        assert len(engine_cache._engines) == 2
+    dispose_engines()
@@ -0,0 +1,114 @@
+import os
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ddpui.settings")
+os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
+django.setup()
+
+
+from io import StringIO
+from unittest.mock import patch, Mock, MagicMock
+
+from psycopg2 import sql
+
+from ddpui.datainsights.warehouse.postgres import PostgresClient
+
+
+def test_copy_table_to_csv_copies_from_a_select():
+    """COPY from a query, so views & partitioned tables can be downloaded too"""
+    cursor = Mock()
+    connection = Mock()
+    connection.cursor.return_value = MagicMock(
+        __enter__=Mock(return_value=cursor), __exit__=Mock(return_value=False)
+    )
+    with patch.object(PostgresClient, "__init__", return_value=None):
+        client = PostgresClient({})
+    client.engine = Mock(raw_connection=Mock(return_value=connection))
+
+    sink = StringIO()
+    client.copy_table_to_csv("my schema", "my_table", sink)
+
+    cursor.copy_expert.assert_called_once_with(
+        sql.SQL("COPY (SELECT * FROM {}.{}) TO STDOUT WITH CSV HEADER").format(
+            sql.Identifier("my schema"), sql.Identifier("my_table")
+        ),
+        sink,
+    )
+    connection.close.assert_called_once()
+    connection.invalidate.assert_not_called()
+
+
+def test_postgres_client_honours_port_and_ssl_mode():
+    """A non default port & the ssl mode from the airbyte config reach the engine"""
+    creds = {
+        "host": "db.example.com",
+        "port": "6543",
+        "database": "warehouse",
+        "username": "ddp",
+        "password": "p@ss/word",
+        "ssl_mode": {"mode": "require"},
+    }
+    with patch(
+        "ddpui.datainsights.warehouse.postgres.get_engine"
+    ) as mock_get_engine, patch("ddpui.datainsights.warehouse.postgres.inspect"):
+        PostgresClient(creds)
+
+    _, passed_creds, url = mock_get_engine.call_args.args
+    assert passed_creds == creds
+    assert (url.host, url.port, url.database) == ("db.example.com", 6543, "warehouse")
+    assert (url.username, url.password) == ("ddp", "p@ss/word")
+    assert mock_get_engine.call_args.kwargs["open_tunnel"] is None
+    assert mock_get_engine.call_args.kwargs["connect_args"] == {"sslmode": "require"}
+
+
+def test_postgres_client_leaves_verify_modes_to_libpq_default():
+    """verify-ca / verify-full need certificate files, so they are not forwarded"""
+    creds = {
+        "host": "db.example.com",
+        "port": 5432,
+        "database": "warehouse",
+        "username": "ddp",
+        "password": "password",
+        "ssl_mode": {"mode": "verify-ca", "ca_certificate": "-----BEGIN..."},
+    }
+    with patch(
+        "ddpui.datainsights.warehouse.postgres.get_engine"
+    ) as mock_get_engine, patch("ddpui.datainsights.warehouse.postgres.inspect"):
+        PostgresClient(creds)
+
+    assert mock_get_engine.call_args.kwargs["connect_args"] == {}
+
+
+def test_postgres_client_opens_ssh_tunnel():
+    """With an ssh tunnel_method the client forwards to the database's host & port"""
+    creds = {
+        "host": "10.0.0.5",
+        "port": 6543,
+        "database": "warehouse",
+        "username": "ddp",
+        "password": "password",
+        "tunnel_method": {
+            "tunnel_method": "SSH_PASSWORD_AUTH",
+            "tunnel_host": "bastion.example.com",
+            "tunnel_port": 2222,
+            "tunnel_user": "jump",
+            "tunnel_user_password": "secret",
+        },
+    }
+    with patch(
+        "ddpui.datainsights.warehouse.postgres.get_engine"
+    ) as mock_get_engine, patch("ddpui.datainsights.warehouse.postgres.inspect"):
+        PostgresClient(creds)
+
+    with patch(
+        "ddpui.datainsights.warehouse.postgres.SSHTunnelForwarder"
+    ) as mock_forwarder:
+        tunnel = mock_get_engine.call_args.kwargs["open_tunnel"]()
+
+    assert tunnel is mock_forwarder.return_value
+    tunnel.start.assert_called_once()
+    assert mock_forwarder.call_args.args == (("bastion.example.com", 2222),)
+    assert mock_forwarder.call_args.kwargs["ssh_username"] == "jump"
+    assert mock_forwarder.call_args.kwargs["ssh_password"] == "secret"
+    assert mock_forwarder.call_args.kwargs["ssh_pkey"] is None
+    assert mock_forwarder.call_args.kwargs["remote_bind_address"] == ("10.0.0.5", 6543)
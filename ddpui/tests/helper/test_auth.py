@@ -15,8 +15,11 @@ from ddpui.auth import (
     CanManagePipelines,
     CanManageUsers,
     FullAccess,
+    CustomAuthMiddleware,
+    has_permission,
 )
 from ddpui.models.org import Org
+from ddpui.models.role_based_access import Role, Permission, RolePermission
 
 pytestmark = pytest.mark.django_db
 
@@ -324,3 +327,47 @@ def test_fullaccess_reportviewer_success(org_user_reportviewer: OrgUser):
     with pytest.raises(HttpError) as excinfo:
         aou.authenticate(request, temp_token)
     assert str(excinfo.value) == UNAUTHORIZED
+
+
+# ====================================================================================
+def test_customauthmiddleware_unknown_token():
+    aou = CustomAuthMiddleware()
+    request = Mock(headers={})
+    with pytest.raises(HttpError) as excinfo:
+        aou.authenticate(request, "key-dne")
+    assert str(excinfo.value) == UNAUTHORIZED
+
+
+def test_customauthmiddleware_success(
+    org_user_accountmanager: OrgUser, django_assert_num_queries
+):
+    role = Role.objects.create(slug="test-auth-role", name="Test Auth Role")
+    for slug in ["test-auth-view", "test-auth-edit"]:
+        permission = Permission.objects.create(slug=slug, name=slug)
+        RolePermission.objects.create(role=role, permission=permission)
+    org_user_accountmanager.new_role = role
+    org_user_accountmanager.save()
+    temp_token = Token.objects.create(key="ttt", user=org_user_accountmanager.user)
+
+    aou = CustomAuthMiddleware()
+    request = Mock(headers={"x-dalgo-org": org_user_accountmanager.org.slug})
+    with django_assert_num_queries(1):
+        response = aou.authenticate(request, temp_token.key)
+        assert response.orguser == org_user_accountmanager
+        assert response.orguser.org == org_user_accountmanager.org
+        assert response.user == org_user_accountmanager.user
+    assert response.permissions == {"test-auth-view", "test-auth-edit"}
+
+    @has_permission(["test-auth-view"])
+    def endpoint(request):  # pylint: disable=unused-argument
+        return "ok"
+
+    @has_permission(["test-auth-view", "test-auth-delete"])
+    def restricted_endpoint(request):  # pylint: disable=unused-argument
+        return "ok"
+
+    assert endpoint(response) == "ok"
+    with pytest.raises(HttpError) as excinfo:
+        restricted_endpoint(response)
+    assert str(excinfo.value) == UNAUTHORIZED
+    temp_token.delete()
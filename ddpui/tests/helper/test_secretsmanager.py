@@ -10,6 +10,7 @@ from ddpui.utils.secretsmanager import (
     save_warehouse_credentials,
     update_warehouse_credentials,
     retrieve_warehouse_credentials,
+    retrieve_warehouse_credentials_cached,
     delete_warehouse_credentials,
     save_superset_usage_dashboard_credentials,
     retrieve_superset_usage_dashboard_credentials,
@@ -101,6 +102,7 @@ def test_update_warehouse_credentials(mock_getclient: Mock):
     update_secret.assert_called_once_with(
         SecretId="credentialskey", SecretString='{"credkey": "credval"}'
     )
+    warehouse.save.assert_called_once_with(update_fields=["updated_at"])
 
 
 @patch("ddpui.utils.secretsmanager.get_client")
@@ -114,6 +116,26 @@ def test_retrieve_warehouse_credentials(
     get_secret_value.assert_called_once_with(SecretId="credentialskey")
 
 
+@patch("ddpui.utils.secretsmanager.get_client")
+def test_retrieve_warehouse_credentials_cached(
+    mock_getclient: Mock,
+):
+    get_secret_value = Mock(return_value={"SecretString": '{"credkey": "credval"}'})
+    mock_getclient.return_value = Mock(get_secret_value=get_secret_value)
+    warehouse = Mock(id=-1, credentials="credentialskey", updated_at="t1")
+
+    assert retrieve_warehouse_credentials_cached(warehouse) == {"credkey": "credval"}
+    assert retrieve_warehouse_credentials_cached(warehouse) == {"credkey": "credval"}
+    get_secret_value.assert_called_once_with(SecretId="credentialskey")
+
+    # the warehouse was updated; credentials are fetched again
+    warehouse.updated_at = "t2"
+    retrieve_warehouse_credentials_cached(warehouse)
+    assert get_secret_value.call_count == 2
+
+    delete_warehouse_credentials(warehouse)
+
+
 @patch("ddpui.utils.secretsmanager.get_client")
 def test_delete_warehouse_credentials(
     mock_getclient: Mock,
@@ -1,3 +1,7 @@
+import gzip
+from decimal import Decimal
+from datetime import datetime
+
 from ddpui.utils.helpers import (
     remove_nested_attribute,
     isvalid_email,
@@ -6,6 +10,9 @@ from ddpui.utils.helpers import (
     map_airbyte_keys_to_postgres_keys,
     update_dict_but_not_stars,
     nice_bytes,
+    convert_table_rows_to_standard_types,
+    dump_json_cells,
+    gzip_chunks,
 )
 
 
@@ -186,3 +193,50 @@ def test_nice_bytes():
     assert nice_bytes(1024) == "1.0 KB"
     assert nice_bytes(1024 * 1024) == "1.0 MB"
     assert nice_bytes(3 * 1024 * 1024) == "3.0 MB"
+
+
+def test_convert_table_rows_to_standard_types():
+    """tests convert_table_rows_to_standard_types"""
+    rows = [
+        {
+            "id": 1,
+            "name": "a",
+            "amount": Decimal("1.5"),
+            "created": datetime(2024, 1, 1, 10, 0, 0),
+            "payload": {"key": "value"},
+            "tags": ["x", "y"],
+            "empty": [],
+            "missing": None,
+        }
+    ]
+    assert convert_table_rows_to_standard_types(rows) == [
+        {
+            "id": 1,
+            "name": "a",
+            "amount": 1.5,
+            "created": "2024-01-01 10:00:00",
+            "payload": '{"key": "value"}',
+            "tags": '["x", "y"]',
+            "empty": [],
+            "missing": None,
+        }
+    ]
+
+
+def test_dump_json_cells():
+    """tests dump_json_cells"""
+    rows = [(1, {"key": "value"}, ["x"]), (2, None, [])]
+    assert dump_json_cells(rows, []) is rows
+    assert dump_json_cells(rows, [1, 2]) == [
+        [1, '{"key": "value"}', '["x"]'],
+        [2, None, []],
+    ]
+
+
+def test_gzip_chunks():
+    """tests gzip_chunks"""
+    source = iter([b"col1,col2\n", b"value1,value2\n" * 100, b""])
+    compressed = list(gzip_chunks(source))
+    assert gzip.decompress(b"".join(compressed)) == (
+        b"col1,col2\n" + b"value1,value2\n" * 100
+    )
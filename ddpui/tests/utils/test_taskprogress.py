@@ -0,0 +1,24 @@
+import json
+from unittest.mock import Mock, patch
+
+from ddpui.utils.taskprogress import TaskProgress
+
+
+def test_taskprogress_add_pipelines_expiry_with_first_write():
+    """the expiry goes out with the first write and is not repeated"""
+    redis = Mock()
+    pipeline = redis.pipeline.return_value
+    with patch("ddpui.utils.taskprogress.RedisClient.get_instance", return_value=redis):
+        taskprogress = TaskProgress("task-id", "hashkey", 60)
+        taskprogress.add({"message": "first"})
+        taskprogress.add({"message": "second"})
+
+    redis.pipeline.assert_called_with(transaction=False)
+    pipeline.hset.assert_called_with(
+        "hashkey",
+        "task-id",
+        json.dumps([{"message": "first"}, {"message": "second"}]),
+    )
+    pipeline.expire.assert_called_once_with("hashkey", 60)
+    assert pipeline.execute.call_count == 2
+    redis.hset.assert_not_called()
@@ -9,6 +9,7 @@ from decimal import Decimal
 from datetime import datetime, date
 import csv
 import io
+import zlib
 
 
 def runcmd(cmd: str, cwd: str):
@@ -162,6 +163,60 @@ def convert_to_standard_types(obj):
     return obj
 
 
+def convert_table_rows_to_standard_types(rows: list[dict]) -> list[dict]:
+    """
+    single pass over rows of table data; non-empty json (list / dict) cells are dumped
+    to strings, everything else is converted as in convert_to_standard_types
+    rows are updated in place and returned
+    """
+    dumps = json.dumps
+    for row in rows:
+        for key, value in row.items():
+            if value is None or isinstance(value, (str, int, float)):
+                continue
+            if isinstance(value, (list, dict)):
+                if value:
+                    row[key] = dumps(value, default=str)
+            else:
+                row[key] = convert_to_standard_types(value)
+    return rows
+
+
+def dump_json_cells(rows: list, column_indexes: list[int]) -> list:
+    """
+    json dumps the non-empty list / dict values at the given positions of each row
+    rows are returned untouched when there are no such positions, as lists otherwise
+    """
+    if not column_indexes:
+        return rows
+    dumps = json.dumps
+    flat_rows = []
+    for row in rows:
+        row = list(row)
+        for index in column_indexes:
+            if row[index]:
+                row[index] = dumps(row[index], default=str)
+        flat_rows.append(row)
+    return flat_rows
+
+
+def gzip_chunks(chunks, compresslevel: int = 1):
+    """
+    gzips an iterable of byte chunks on the fly, yielding the compressed chunks
+    the source is closed when the compressed stream is
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
 def convert_sqlalchemy_rows_to_csv_string(rows: list[dict]):
     """converts a list of sqlalchemy rows to a csv string"""
     # output = io.StringIO()
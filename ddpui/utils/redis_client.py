@@ -30,7 +30,14 @@ class RedisClient:
                 if cls._redis_instance is None:
                     host = os.getenv("REDIS_HOST", "localhost")
                     port = int(os.getenv("REDIS_PORT", "6379"))
-                    cls._redis_instance = Redis(host=host, port=port)
+                    # one pooled client per process; keepalive & health checks
+                    # keep the idle pooled connections usable
+                    cls._redis_instance = Redis(
+                        host=host,
+                        port=port,
+                        socket_keepalive=True,
+                        health_check_interval=30,
+                    )
                 cls.lock.release()
         return cls._redis_instance
 
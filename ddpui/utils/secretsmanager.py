@@ -1,5 +1,8 @@
 import os
 import json
+import copy
+import time
+import threading
 from uuid import uuid4
 import boto3
 from ddpui.utils.custom_logger import CustomLogger
@@ -7,6 +10,11 @@ from ddpui.models.org import Org, OrgWarehouse, OrgDbt
 
 logger = CustomLogger("ddpui")
 
+# warehouse credentials are cached in-process to skip the secrets manager round trip
+WAREHOUSE_CREDENTIALS_CACHE_TTL_SECONDS = 300
+_warehouse_credentials_cache: dict = {}
+_warehouse_credentials_cache_lock = threading.Lock()
+
 
 class DevSecretsManager:
     """a stub class to avoid AWS costs in development"""
@@ -174,6 +182,9 @@ def update_warehouse_credentials(warehouse: OrgWarehouse, credentials: dict):
         "updated warehouse credentials in secrets manager under name="
         + response["Name"]
     )
+    # bumping updated_at invalidates the cached credentials in every process
+    forget_warehouse_credentials(warehouse)
+    warehouse.save(update_fields=["updated_at"])
 
 
 def retrieve_warehouse_credentials(warehouse: OrgWarehouse) -> dict | None:
@@ -187,8 +198,38 @@ def retrieve_warehouse_credentials(warehouse: OrgWarehouse) -> dict | None:
     )
 
 
+def retrieve_warehouse_credentials_cached(warehouse: OrgWarehouse) -> dict | None:
+    """
+    same as retrieve_warehouse_credentials, but served from an in-process cache
+    for a few minutes; the cache key includes the warehouse's updated_at
+    """
+    key = (warehouse.id, warehouse.credentials, warehouse.updated_at)
+    now = time.monotonic()
+    cached = _warehouse_credentials_cache.get(key)
+    if cached is None or cached[0] <= now:
+        credentials = retrieve_warehouse_credentials(warehouse)
+        cached = (now + WAREHOUSE_CREDENTIALS_CACHE_TTL_SECONDS, credentials)
+        with _warehouse_credentials_cache_lock:
+            # drop expired entries, then cache the fresh ones
+            for stale_key in [
+                k for k, v in _warehouse_credentials_cache.items() if v[0] <= now
+            ]:
+                del _warehouse_credentials_cache[stale_key]
+            _warehouse_credentials_cache[key] = cached
+    # callers are free to modify the credentials they get back
+    return copy.deepcopy(cached[1])
+
+
+def forget_warehouse_credentials(warehouse: OrgWarehouse) -> None:
+    """drops a warehouse's credentials from the in-process cache"""
+    with _warehouse_credentials_cache_lock:
+        for key in [k for k in _warehouse_credentials_cache if k[0] == warehouse.id]:
+            del _warehouse_credentials_cache[key]
+
+
 def delete_warehouse_credentials(warehouse: OrgWarehouse) -> None:
     """deletes the secret from SM corresponding to a warehouse's credentials"""
+    forget_warehouse_credentials(warehouse)
     aws_sm = get_client()
     try:
         aws_sm.delete_secret(SecretId=warehouse.credentials)
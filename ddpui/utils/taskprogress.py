@@ -23,11 +23,14 @@ class TaskProgress:
     def add(self, progress) -> None:
         """append the latest progress to the list and update in redis"""
         self.taskprogress.append(progress)
-        self.redis.hset(self.hashkey, self.task_id, json.dumps(self.taskprogress))
+        # the first add also sets the expiry; send both in one round trip
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hset(self.hashkey, self.task_id, json.dumps(self.taskprogress))
         if not self.expiration_set:
             if self.expire_in_seconds:
-                self.redis.expire(self.hashkey, self.expire_in_seconds)
+                pipeline.expire(self.hashkey, self.expire_in_seconds)
             self.expiration_set = True
+        pipeline.execute()
 
     def remove(self) -> None:
         """removes the hash from redis"""
@@ -0,0 +1,51 @@
+import json
+
+from redis.exceptions import RedisError
+
+from ddpui.utils.custom_logger import CustomLogger
+from ddpui.utils.redis_client import RedisClient
+
+logger = CustomLogger("ddpui")
+
+WAREHOUSE_METADATA_CACHE_PREFIX = "whmeta"
+# column specs change only with syncs & transforms, which clear the cache anyway
+COLUMN_CATALOG_TTL_SECONDS = 6 * 60 * 60
+
+
+def warehouse_metadata_cache_key(org_id: int, wtype: str, op: str, *args) -> str:
+    """redis key for a cached warehouse metadata lookup"""
+    return ":".join(
+        [WAREHOUSE_METADATA_CACHE_PREFIX, str(org_id), str(wtype), op]
+        + [str(arg) for arg in args]
+    )
+
+
+def get_warehouse_metadata(key: str):
+    """returns the cached value or None; redis errors count as a miss"""
+    try:
+        value = RedisClient.get_instance().get(key)
+    except RedisError as err:
+        logger.error(f"failed to read {key} from redis: {err}")
+        return None
+    return json.loads(value) if value is not None else None
+
+
+def set_warehouse_metadata(key: str, value, ttl: int) -> None:
+    """caches the value for ttl seconds; redis errors are logged and ignored"""
+    try:
+        RedisClient.get_instance().set(key, json.dumps(value), ex=ttl)
+    except RedisError as err:
+        logger.error(f"failed to write {key} to redis: {err}")
+
+
+def clear_warehouse_metadata_cache(org_id: int) -> None:
+    """drops every cached metadata lookup for the org"""
+    try:
+        redis = RedisClient.get_instance()
+        keys = list(
+            redis.scan_iter(match=f"{WAREHOUSE_METADATA_CACHE_PREFIX}:{org_id}:*")
+        )
+        if keys:
+            redis.delete(*keys)
+    except RedisError as err:
+        logger.error(f"failed to clear warehouse metadata cache for {org_id}: {err}")